@@ -4,43 +4,73 @@ Simple TeamBlender - Basic team iteration
 """
 
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+import asyncio
+import bisect
+import heapq
+import os
+import queue
+import re
+import shutil
+import sys
+import time
 from pathlib import Path
 import scan
 import json
-from portchecker import check_ports
-from concurrent.futures import ThreadPoolExecutor
-import time
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+try:
+    import orjson
+except ImportError:  # Optional, only speeds up writing the ports file
+    orjson = None
+from portchecker import check_ports_async
 import threading
 from datetime import datetime
 
+LOG_BATCH_SIZE = 64  # Most queued messages written per stdout flush
+
 class Blender:
     
     def __init__(self, config_file="blender_config.yaml"):
         self.config_file = config_file
         self.config = self.load_config()
         self.host_pattern = self.config['hosts']['host_pattern']
-        self.teams = list(range(self.config['hosts']['teams']['start'], self.config['hosts']['teams']['end'] + 1))
+        self.teams = tuple(range(self.config['hosts']['teams']['start'], self.config['hosts']['teams']['end'] + 1))
         self.discovery_ports = self.config['scan']['discovery_ports']
         self.ports = self.config['scan']['ports']
         self.ports_file = self.config['scan']['file']
         self.hosts_file = self.config['hosts']['file']
         self.reference_team = self.config['hosts']['reference_team']
         self.timeout = self.config['port_checker'].get('timeout', 3)
+        self.fast_timeout = self.config['port_checker'].get('timeout_fast')
+        self.max_retries = self.config['port_checker'].get('max_retries', 2)
+        self.retry_delay = self.config['port_checker'].get('delay_between_retries', 1)
+        self.healthy_interval = self.config['port_checker'].get('healthy_interval', 10)
         self.placeholder = self.config['hosts'].get('placeholder', 'team')
         self.max_workers = self.config['execution'].get('max_workers', 4)
         self.reference_subnet = self.host_pattern.format(**{self.placeholder: self.reference_team})
+        # Everything before the placeholder is fixed, the team number follows it
+        self._host_prefix = self.host_pattern.split(f"{{{self.placeholder}}}", 1)[0]
+        self._host_re = re.compile(re.escape(self._host_prefix) + r'(?P<team>\d+)(?P<rest>.*)', re.DOTALL)
         self.hosts = []
         self.ports = {}
-        self.stop_event = threading.Event()
-        self.down_hosts = set()  # Centralized set of (team, host) tuples for down hosts
-        self.down_hosts_lock = threading.Lock()  # Thread-safe access to down_hosts
+        self.formatted_hosts = {}  # host pattern -> formatted host per team, same order as self.teams
+        # host pattern -> sorted list of (team, formatted host) for down hosts. Each list is
+        # only written by the task monitoring that host
+        self.down_hosts = {}
         self.report_interval = self.config.get('report_interval', 30)  # Report every 30 seconds
+        self._log_queue = queue.Queue()  # Messages from reset check, written by _log_drain
     
     def load_config(self):
         """Load configuration from YAML file"""
         config_path = Path(self.config_file)
         with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
 
 
     def generate_hosts_file(self, hosts):
@@ -51,10 +81,8 @@ class Blender:
             # Backup existing file before overwriting
             if Path(self.hosts_file).exists():
                 backup_file = f"{self.hosts_file}.backup"
-                # Remove existing backup file if it exists
-                if Path(backup_file).exists():
-                    Path(backup_file).unlink()
-                Path(self.hosts_file).rename(backup_file)
+                # os.replace overwrites any existing backup in a single atomic rename
+                os.replace(self.hosts_file, backup_file)
                 print(f"Backed up existing {self.hosts_file} to {backup_file}")
            
             with open(self.hosts_file, 'w') as f:
@@ -78,18 +106,24 @@ class Blender:
     def generate_ports_file(self, ports):
         try:
             unformatted_ports = {self.unformat(host, self.reference_team): port_info for host, port_info in ports.items()}
+            if orjson is not None:
+                data = orjson.dumps(unformatted_ports, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(unformatted_ports, indent=2).encode()
             if Path(self.ports_file).exists():
                 backup_file = f"{self.ports_file}.backup"
-                # Remove existing backup file if it exists
-                if Path(backup_file).exists():
-                    Path(backup_file).unlink()
-                Path(self.ports_file).rename(backup_file)
+                shutil.copy2(self.ports_file, backup_file)
                 print(f"Backed up existing {self.ports_file} to {backup_file}")
-            with open(self.ports_file, 'w') as f:
-                json.dump(unformatted_ports, f, indent=2)
+            # Write to a temp file and swap it in so the ports file is never missing or partial
+            tmp_file = f"{self.ports_file}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, self.ports_file)
             return True
         except Exception as e:
             print(f"Error generating ports file: {e}")
+            # Don't leave a half written temp file behind
+            Path(f"{self.ports_file}.tmp").unlink(missing_ok=True)
             return False
     def load_ports_file(self):
         try:
@@ -101,94 +135,122 @@ class Blender:
             self.ports = {}    
 
     def unformat(self, formatted_string, format_string):
-        unformatted_string = ''
-        format_string = str(format_string)
-        i = 0
-        try:
-            while i < len(formatted_string):
-                x = formatted_string[i]
-                y = self.host_pattern[i]
-                if x == y:
-                    unformatted_string += x
-                    i += 1
-                else:
-                    x = formatted_string[i+len(format_string)]
-                    j = i
-                    z = self.host_pattern[j]
-                    print(x)
-                    while z != x:
-                        unformatted_string += z
-                        j += 1
-                        z = self.host_pattern[j]
-                    unformatted_string += formatted_string[i+len(format_string):]
-                    break
-        except Exception as e:
-            print(f"Error unformatting string: {e}")
-        return unformatted_string
+        """Turn a host found for one team back into a host pattern for all teams"""
+        match = self._host_re.match(formatted_string)
+        if not match or match.group('team') != str(format_string):
+            return formatted_string
+        return f"{self._host_prefix}{{{self.placeholder}}}{match.group('rest')}"
 
-    def check_host_continuous(self, host_ports_pair):
-        """Continuously check a single host across all teams until stop event is set"""
-        host, ports = host_ports_pair
+    async def check_host_continuous(self, host, ports, limit):
+        """Continuously check a single host across all teams until the task is cancelled"""
+        # Bind everything the loop touches to locals once, these never change during a run
+        entries = list(zip(self.teams, self.formatted_hosts[host]))
+        down = self.down_hosts[host]
+        timeout, fast_timeout = self.timeout, self.fast_timeout
+        healthy_interval, max_retries, retry_delay = self.healthy_interval, self.max_retries, self.retry_delay
+        log = self._log
+        bisect_left, insort = bisect.bisect_left, bisect.insort
+        monotonic = time.monotonic
+        # When each team's host last answered, hosts seen up recently are not probed again
+        last_ok = [float('-inf')] * len(entries)
+        
+        def is_down(entry):
+            j = bisect_left(down, entry)
+            return j < len(down) and down[j] == entry
+        
+        async def check_team(formatted_host, retries):
+            # Retry failures so one dropped connect doesn't raise an alert.
+            # The shared semaphore caps open probe sockets across all hosts
+            for attempt in range(retries + 1):
+                if attempt:
+                    await asyncio.sleep(retry_delay)
+                if await check_ports_async(formatted_host, ports, timeout, fast_timeout, limit):
+                    return True
+            return False
         
-        while not self.stop_event.is_set():
+        while True:
             try:
-                for team in self.teams:
-                    if self.stop_event.is_set():
-                        break
-                    
-                    formatted_host = host.format(**{self.placeholder: team})
-                    open_port = check_ports(formatted_host, ports)
-                    host_team_tuple = (team, formatted_host)
-                    
-                    with self.down_hosts_lock:
-                        if not open_port:
-                            # Host is down
-                            if host_team_tuple not in self.down_hosts:
-                                # New down host - add to set and print alert
-                                self.down_hosts.add(host_team_tuple)
-                                print(f"TEAM {team} - HOST {formatted_host} - POSSIBLE BOX RESET")
-                            # If already in set, don't print duplicate alert
-                        else:
-                            # Host is up
-                            if host_team_tuple in self.down_hosts:
-                                # Host recovered - remove from set and print recovery
-                                self.down_hosts.remove(host_team_tuple)
-                                print(f"TEAM {team} - HOST {formatted_host} - RECOVERED")
+                now = monotonic()
+                due = [i for i, ts in enumerate(last_ok) if now - ts >= healthy_interval]
+                # Probe every team's copy of this host that is due at once, hosts
+                # already known to be down get a single attempt per sweep
+                checks = [asyncio.create_task(check_team(entries[i][1], 0 if is_down(entries[i]) else max_retries)) for i in due]
+                try:
+                    results = await asyncio.gather(*checks)
+                finally:
+                    # If one check failed, stop the rest so their sockets and semaphore slots are freed
+                    for check in checks:
+                        check.cancel()
+                    await asyncio.gather(*checks, return_exceptions=True)
+                
+                # Look entries up again on the current list, it may have changed during the await
+                for i, open_port in zip(due, results):
+                    team, formatted_host = entry = entries[i]
+                    found = is_down(entry)
+                    if not open_port:
+                        # Host is down
+                        if not found:
+                            # New down host - insert in order and print alert
+                            insort(down, entry)
+                            log(f"TEAM {team} - HOST {formatted_host} - POSSIBLE BOX RESET")
+                        # If already recorded, don't print duplicate alert
+                    else:
+                        last_ok[i] = monotonic()
+                        # Host is up
+                        if found:
+                            # Host recovered - forget it and print recovery
+                            down.remove(entry)
+                            log(f"TEAM {team} - HOST {formatted_host} - RECOVERED")
                 
                 # Small delay between checks to prevent overwhelming the network
-                if not self.stop_event.wait(0.1):  # Non-blocking wait with 100ms timeout
-                    continue
-                else:
-                    break
-                    
+                await asyncio.sleep(0.1)
+                
             except Exception as e:
-                print(f"Error checking host {host}: {e}")
+                log(f"Error checking host {host}: {e}")
                 # Continue checking even if there's an error
-                if not self.stop_event.wait(1):  # Wait 1 second before retrying
-                    continue
-                else:
+                await asyncio.sleep(1)  # Wait 1 second before retrying
+
+    def snapshot_down_hosts(self):
+        """Return a sorted list of (team, host) tuples for all hosts currently down"""
+        # Each list is already sorted, so merging them avoids a full sort on every report
+        return list(heapq.merge(*self.down_hosts.values()))
+
+    def _log(self, msg):
+        """Queue a message for the log thread instead of printing from the event loop"""
+        self._log_queue.put(msg)
+
+    def _log_drain(self):
+        """Write queued messages to stdout in batches until a None sentinel arrives"""
+        while True:
+            batch = [self._log_queue.get()]
+            # Pick up whatever else is waiting so one write and flush covers the batch
+            while batch[-1] is not None and len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._log_queue.get_nowait())
+                except queue.Empty:
                     break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                sys.stdout.write("\n".join(batch) + "\n")
+                sys.stdout.flush()
+            if stop:
+                return
 
-    def report_down_hosts(self):
-        """Periodically report the current status of down hosts"""
-        last_report_time = time.time()
-        
-        while not self.stop_event.is_set():
-            time.sleep(1)  # Check every second
-            
-            current_time = time.time()
-            if current_time - last_report_time >= self.report_interval:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                with self.down_hosts_lock:
-                    if self.down_hosts:
-                        print(f"\n=== STATUS REPORT [{timestamp}]: {len(self.down_hosts)} hosts currently down ===")
-                        for team, host in sorted(self.down_hosts):
-                            print(f"  TEAM {team} - {host}")
-                        print("=" * 50)
-                    else:
-                        print(f"\n=== STATUS REPORT [{timestamp}]: All hosts are UP ===")
-                
-                last_report_time = current_time
+    async def report_down_hosts(self):
+        """Periodically report the current status of down hosts until the task is cancelled"""
+        while True:
+            await asyncio.sleep(self.report_interval)
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            down_hosts = self.snapshot_down_hosts()
+            if down_hosts:
+                lines = [f"\n=== STATUS REPORT [{timestamp}]: {len(down_hosts)} hosts currently down ==="]
+                lines += [f"  TEAM {team} - {host}" for team, host in down_hosts]
+                lines.append("=" * 50)
+                self._log("\n".join(lines))
+            else:
+                self._log(f"\n=== STATUS REPORT [{timestamp}]: All hosts are UP ===")
 
 
         
@@ -209,87 +271,86 @@ class Blender:
         try:
             self.load_ports_file()
             print(f"Loaded ports for {len(self.ports)} hosts from {self.ports_file}")
+            # Host names per team never change, so format them once up front
+            self.formatted_hosts = {
+                host: [host.format(**{self.placeholder: team}) for team in self.teams]
+                for host in self.ports
+            }
         except Exception as e:
             print(f"Error during reset check: {e}")
             return
         
-        # Clear any previous events
-        self.stop_event.clear()
-        
-        # Clear the down hosts set for a fresh start
-        with self.down_hosts_lock:
-            self.down_hosts.clear()
+        # Give every host its own empty down hosts list for a fresh start
+        self.down_hosts = {host: [] for host in self.ports}
         
-        print(f"Starting reset check monitoring with {self.max_workers} threads... (Press Ctrl+C to stop)")
+        print(f"Starting reset check monitoring with up to {self._max_open_probes()} open probes... (Press Ctrl+C to stop)")
         print(f"Status reports will be generated every {self.report_interval} seconds")
         
-        # Start threads for each host
-        executor = ThreadPoolExecutor(max_workers=self.max_workers + 1)  # +1 for reporter thread
-        host_ports_pairs = list(self.ports.items())
+        # Output goes through one log thread so stdout writes are batched off the event loop
+        log_thread = threading.Thread(target=self._log_drain, daemon=True, name="log")
+        log_thread.start()
         
+        reason = "User interruption"
         try:
-            # Submit all host monitoring tasks
-            futures = [executor.submit(self.check_host_continuous, pair) for pair in host_ports_pairs]
-            
-            # Submit the periodic reporting task
-            reporter_future = executor.submit(self.report_down_hosts)
-            futures.append(reporter_future)
-            
-            print(f"Started {len(futures)-1} monitoring threads + 1 reporter thread")
-            print("Monitoring active hosts... Press Ctrl+C to stop")
-            
-            # Poll for completion or interruption
-            while True:
-                # Check if any thread has finished (shouldn't happen unless error)
-                finished_futures = [f for f in futures if f.done()]
-                
-                if finished_futures:
-                    print(f"Warning: {len(finished_futures)} threads finished unexpectedly")
-                    for future in finished_futures:
-                        try:
-                            future.result()  # Get any exceptions
-                        except Exception as e:
-                            print(f"Thread error: {e}")
-                
-                # Sleep briefly before next poll
-                with self.down_hosts_lock:
-                    if self.down_hosts:
-                        print("---------- HOSTS DOWN STATUS ----------")
-                        for team, host in sorted(self.down_hosts):
-                            print(f"  TEAM {team} - {host}")
-                time.sleep(30)
-                
+            reason = asyncio.run(self._reset_check_async())
         except KeyboardInterrupt:
-            print("\nReset check stopped by user (Ctrl+C)")
-            self._shutdown_threads(futures, "User interruption")
-            
+            self._log("\nReset check stopped by user (Ctrl+C)")
+        except Exception as e:
+            self._log(f"Error during reset check: {e}")
+            reason = "Unexpected error"
         finally:
-            # Ensure executor is properly shutdown
-            executor.shutdown(wait=True)
+            self._report_shutdown(reason)
+            self._log_queue.put(None)
+            log_thread.join()
+
+    def _max_open_probes(self):
+        """How many probe sockets may be open at once, kept well below the fd limit"""
+        probes = self.max_workers * 10
+        if resource is not None:
+            soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft_limit != resource.RLIM_INFINITY:
+                # Leave half the descriptors for files, pipes and the event loop itself
+                probes = max(1, min(probes, soft_limit // 2))
+        return probes
 
-    def _shutdown_threads(self, futures, reason):
-        """Helper method to gracefully shutdown all threads"""
-        print(f"Stopping all monitoring threads due to: {reason}")
+    async def _reset_check_async(self):
+        """Run every host monitor and the reporter as tasks on one event loop, return why it stopped"""
+        if not self.ports:
+            return "No hosts to monitor"
         
-        # Signal all threads to stop
-        self.stop_event.set()
+        limit = asyncio.Semaphore(self._max_open_probes())
+        monitors = [asyncio.create_task(self.check_host_continuous(host, ports, limit)) for host, ports in self.ports.items()]
+        reporter = asyncio.create_task(self.report_down_hosts())
         
-        # Final status report before shutdown
-        with self.down_hosts_lock:
-            if self.down_hosts:
-                print(f"\nFINAL STATUS: {len(self.down_hosts)} hosts were down at shutdown:")
-                for team, host in sorted(self.down_hosts):
-                    print(f"  TEAM {team} - {host}")
+        self._log(f"Started {len(monitors)} host monitors + 1 reporter")
+        self._log("Monitoring active hosts... Press Ctrl+C to stop")
         
-        # Wait for all threads to finish
-        print("Waiting for threads to complete...")
-        for i, future in enumerate(futures):
-            try:
-                future.result(timeout=5)  # Wait up to 5 seconds per thread
-            except Exception as e:
-                print(f"Thread {i+1} shutdown error: {e}")
+        try:
+            # Block until a monitor fails (they never finish otherwise)
+            done, _ = await asyncio.wait(monitors, return_when=asyncio.FIRST_EXCEPTION)
+            self._log(f"Warning: {len(done)} monitors finished unexpectedly")
+            for task in done:
+                if task.exception() is not None:
+                    self._log(f"Monitor error: {task.exception()}")
+            return "Monitoring task failure"
+        finally:
+            # Cancelling the tasks is how monitors and the reporter are told to stop
+            for task in monitors + [reporter]:
+                task.cancel()
+            await asyncio.gather(*monitors, reporter, return_exceptions=True)
+
+    def _report_shutdown(self, reason):
+        """Helper method to report why monitoring stopped and what was still down"""
+        self._log(f"Stopped all monitors due to: {reason}")
+        
+        # Final status report after shutdown
+        down_hosts = self.snapshot_down_hosts()
+        if down_hosts:
+            self._log(f"\nFINAL STATUS: {len(down_hosts)} hosts were down at shutdown:")
+            for team, host in down_hosts:
+                self._log(f"  TEAM {team} - {host}")
         
-        print("All threads stopped. Exiting gracefully...")
+        self._log("All monitors stopped. Exiting gracefully...")
     
 def main():
     import argparse
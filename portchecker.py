@@ -4,21 +4,85 @@ Simple Port Checker
 Reads hosts.txt and checks port connectivity for all hosts.
 """
 
+import asyncio
 import socket
+import struct
+import sys
+import threading
+import time
 
-def check_ports(host, ports, timeout=3):
-    """Check if a list of ports are open on a host"""
-    for port in ports:
+DNS_TTL = 900  # Seconds a resolved address is reused before looking it up again
+
+# SO_LINGER on with a zero timeout: closing a probe sends RST instead of lingering in FIN_WAIT
+_ABORT_ON_CLOSE = struct.pack('HH' if sys.platform == 'win32' else 'ii', 1, 0)
+
+_dns_cache = {}  # host -> (ip, expiry)
+_dns_lock = threading.Lock()
+
+async def _resolve(host):
+    """Resolve a hostname to an IPv4 address, cached for DNS_TTL seconds"""
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(host)
+    if cached and cached[1] > now:
+        return cached[0]
+    # getaddrinfo runs in the loop's executor so a slow lookup doesn't stall other probes
+    infos = await asyncio.get_running_loop().getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+    ip = infos[0][4][0]
+    with _dns_lock:
+        _dns_cache[host] = (ip, now + DNS_TTL)
+    return ip
+
+async def _connect(host, port, timeout):
+    """Try a single non-blocking TCP connect, True if the port accepted it"""
+    loop = asyncio.get_running_loop()
+    # Running out of local sockets is not a closed port, so only the connect is guarded
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _ABORT_ON_CLOSE)
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            result = sock.connect_ex((host.strip(), port))
-            if result == 0:
+            await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout)
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+async def _probe_port(host, port, timeout, limit=None):
+    """Probe one port, holding a slot in limit (if given) while its socket is open"""
+    if limit is None:
+        return await _connect(host, port, timeout)
+    # limit caps open probe sockets, the timeout only starts once a slot is free
+    async with limit:
+        return await _connect(host, port, timeout)
+
+async def _probe_ports(host, ports, timeout, limit=None):
+    """Probe all ports concurrently, return True on the first open one"""
+    pending = {asyncio.create_task(_probe_port(host, port, timeout, limit)) for port in ports}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if any(task.result() for task in done):
                 return True
-            sock.close()
-        except KeyboardInterrupt as e:
-            raise e
-        except:
-            pass
-    return False
+        return False
+    finally:
+        # Stop the remaining probes as soon as we have an answer
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
 
+async def check_ports_async(host, ports, timeout=3, fast_timeout=None, limit=None):
+    """Check if any of the ports are open on a host, trying a quick pass with fast_timeout first.
+    limit is an optional asyncio.Semaphore shared by callers to cap open sockets"""
+    try:
+        ip = await _resolve(host.strip())
+    except OSError:
+        return False
+    # Most hosts answer well within a LAN round trip, only slow ones pay the full timeout
+    if fast_timeout and fast_timeout < timeout:
+        if await _probe_ports(ip, ports, fast_timeout, limit):
+            return True
+    return await _probe_ports(ip, ports, timeout, limit)
+
+def check_ports(host, ports, timeout=3, fast_timeout=None):
+    """Check if a list of ports are open on a host"""
+    return asyncio.run(check_ports_async(host, ports, timeout, fast_timeout))
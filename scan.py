@@ -3,14 +3,21 @@
 Simple RustScan wrapper
 """
 
+import functools
+import os
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import platform
 import pathlib
 from pathlib import Path
 
+@functools.lru_cache(maxsize=1)
 def get_rustscan_binary():
-    """Get the appropriate RustScan binary for the current OS"""
+    """Get the appropriate RustScan binary for the current OS (looked up once per process)"""
     suffixes = {
         'Windows': 'windows.exe',
         'Linux': 'linux',
@@ -27,6 +34,48 @@ def get_rustscan_binary():
     
     raise FileNotFoundError(f'RustScan binary not found for {sys_name}')
 
+def run_rustscan(cmd, timeout=300):
+    """Run RustScan and yield its result lines as they are printed"""
+    print(f"Running: {' '.join(cmd)}")
+    
+    deadline = time.monotonic() + timeout
+    # stderr goes to a temp file so a chatty RustScan can't fill a pipe nobody is reading
+    with tempfile.TemporaryFile('w+') as errors:
+        # Own process group on POSIX so a kill also reaches anything RustScan started
+        posix = os.name == 'posix'
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors, text=True, bufsize=1,
+                              start_new_session=posix) as proc:
+            def kill():
+                try:
+                    if posix:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    else:
+                        proc.kill()
+                except ProcessLookupError:
+                    pass
+            
+            # Reading stdout blocks until RustScan exits, so kill it if it runs too long
+            watchdog = threading.Timer(timeout, kill)
+            watchdog.start()
+            try:
+                for line in proc.stdout:
+                    line = line.strip()
+                    if '->' in line:
+                        yield line
+                proc.wait()
+            finally:
+                watchdog.cancel()
+                # Caller stopped early or something failed, don't let Popen wait on a live scan
+                if proc.poll() is None:
+                    kill()
+        errors.seek(0)
+        stderr = errors.read()
+    
+    if time.monotonic() >= deadline:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
 def scan_subnet(subnet, ports):
     
     # Get binary
@@ -35,24 +84,17 @@ def scan_subnet(subnet, ports):
     # Build command
     cmd = [str(rustscan_path), '-a', subnet, '-g', '-p', ",".join(map(str, ports))]
     
-    print(f"Running: {' '.join(cmd)}")
-    
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0:
-            # Parse results
-            hosts = []
-            for line in result.stdout.splitlines():
-                line = line.strip()
-                if '->' in line:
-                    parts = line.split('->')
-                    host = parts[0].strip()
-                    hosts.append(host)
-            return hosts
-        else:
-            print(f"Error: {result.stderr}")
-            return []
+        # Parse results as RustScan reports them
+        hosts = []
+        for line in run_rustscan(cmd):
+            parts = line.split('->')
+            host = parts[0].strip()
+            hosts.append(host)
+        return hosts
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr}")
+        return []
     except subprocess.TimeoutExpired:
         print("Scan timed out")
         return []
@@ -62,36 +104,39 @@ def scan_subnet(subnet, ports):
 
 
 def scan_hosts(hosts, ports):
+    if not hosts:
+        return {}
+    
+    # Get binary
     rustscan_path = get_rustscan_binary()
     results = {}
-    for host in hosts:
-        cmd = [str(rustscan_path), '-a', host, '-g', "".join(map(str, ports)) if ports else '--top']
-        print(f"Running: {' '.join(cmd)}")
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-
-            if result.returncode == 0:
-                # Parse results
-                for line in result.stdout.splitlines():
-                    line = line.strip()
-                    if '->' in line:
-                        parts = line.split('->')
-                        if len(parts) == 2:
-                            host = parts[0].strip()
-                            port_section = parts[1].strip()
+    
+    # Scan every host in a single RustScan run
+    cmd = [str(rustscan_path), '-a', ",".join(hosts), '-g']
+    cmd += ['-p', ",".join(map(str, ports))] if ports else ['--top']
+    
+    try:
+        # Parse results as RustScan reports them
+        for line in run_rustscan(cmd):
+            parts = line.split('->')
+            if len(parts) == 2:
+                host = parts[0].strip()
+                port_section = parts[1].strip()
 
-                            if port_section.startswith('[') and port_section.endswith(']'):
-                                port_str = port_section[1:-1]
-                                if port_str:
-                                    try:
-                                        ports_found = [int(p.strip()) for p in port_str.split(',')]
-                                        results[host] = sorted(ports_found)
-                                    except ValueError:
-                                        pass
-        except subprocess.TimeoutExpired:
-            print("Scan timed out") 
-        except Exception as e:
-            print(f"Error running scan: {e}")
+                if port_section.startswith('[') and port_section.endswith(']'):
+                    port_str = port_section[1:-1]
+                    if port_str:
+                        try:
+                            ports_found = [int(p.strip()) for p in port_str.split(',')]
+                            results[host] = sorted(ports_found)
+                        except ValueError:
+                            pass
+    except subprocess.CalledProcessError as e:
+        print(f"Error: {e.stderr}")
+    except subprocess.TimeoutExpired:
+        print("Scan timed out") 
+    except Exception as e:
+        print(f"Error running scan: {e}")
     return results
 
 def main():